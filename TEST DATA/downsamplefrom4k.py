@@ -3,6 +3,15 @@ import random
 import shutil
 import csv
 import cv2
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# libjpeg-turbo is optional, OpenCV's encoder is used when it is missing.
+# The PyTurboJPEG wheel does not ship libturbojpeg, so probe that it loads.
+try:
+    from turbojpeg import TurboJPEG, TJSAMP_420
+    TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    TurboJPEG = None
 
 # ===== CONFIGURATION =====
 input_folder = "images_4k"       # 4K images folder
@@ -10,6 +19,8 @@ output_1080p = "images_1080p"
 output_720p = "images_720p"
 sample_count = 300               # Number of images to randomly sample
 jpeg_quality = 85                # JPEG quality (1-100)
+max_workers = os.cpu_count()     # Parallel worker processes
+use_opencl = True                # Resize on the GPU through OpenCL when available
 
 # Target resolutions
 res_1080p = (1920, 1080)
@@ -18,42 +29,98 @@ res_720p = (1280, 720)
 # Supported image extensions
 valid_exts = (".jpg", ".jpeg", ".png", ".bmp", ".tiff")
 
-# ===== PREPARE OUTPUT =====
-os.makedirs(output_1080p, exist_ok=True)
-os.makedirs(output_720p, exist_ok=True)
-
-# ===== LIST AND SAMPLE IMAGES =====
-all_images = [f for f in os.listdir(input_folder) if f.lower().endswith(valid_exts)]
-if len(all_images) < sample_count:
-    raise ValueError(f"Not enough images ({len(all_images)}) to sample {sample_count}")
-sampled_images = random.sample(all_images, sample_count)
-
-# ===== MANIFEST =====
-manifest_file = "image_manifest.csv"
-with open(manifest_file, mode="w", newline="") as csvfile:
-    writer = csv.writer(csvfile)
-    writer.writerow(["filename", "resolution", "filesize_bytes"])  # header
-
-    for fname in sampled_images:
-        src_path = os.path.join(input_folder, fname)
-        img = cv2.imread(src_path)
-        if img is None:
-            print(f"Could not read {fname}, skipping.")
-            continue
-
-        # Resize 1080p
-        img_1080p = cv2.resize(img, res_1080p, interpolation=cv2.INTER_AREA)
-        out_1080p = os.path.join(output_1080p, fname)
-        cv2.imwrite(out_1080p, img_1080p, [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality])
-        writer.writerow([fname, "1080p", os.path.getsize(out_1080p)])
-
-        # Resize 720p
-        img_720p = cv2.resize(img, res_720p, interpolation=cv2.INTER_AREA)
-        out_720p = os.path.join(output_720p, fname)
-        cv2.imwrite(out_720p, img_720p, [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality])
-        writer.writerow([fname, "720p", os.path.getsize(out_720p)])
-
-        print(f"Processed {fname}")
-
-print(f"\n Done! Manifest saved to '{manifest_file}'")
+# ===== WORKER =====
+_tj = None       # One TurboJPEG instance per worker process
+_io_pool = None  # Per-process writer thread, disk writes overlap the next encode
+
+def encode_jpeg(img):
+    global _tj
+    if TurboJPEG is None:
+        _, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality])
+        return buf.tobytes()
+    if _tj is None:
+        _tj = TurboJPEG()
+    return _tj.encode(img, quality=jpeg_quality, jpeg_subsample=TJSAMP_420)  # 4:2:0 like OpenCV
+
+def encode_image(path, img):
+    # JPEG outputs go through the fast encoder, other extensions keep the
+    # codec OpenCV picks from the file extension
+    ext = os.path.splitext(path)[1]
+    if ext.lower() in (".jpg", ".jpeg"):
+        return encode_jpeg(img)
+    _, buf = cv2.imencode(ext, img)  # JPEG quality does not apply to these codecs
+    return buf.tobytes()
+
+def write_bytes(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def resize(img):
+    # 4K -> 1080p, then 720p from the 1080p buffer, far fewer source pixels than the 4K one
+    if use_opencl and cv2.ocl.haveOpenCL():
+        # T-API: both resizes run on the OpenCL device, only the results are copied back
+        u_1080p = cv2.resize(cv2.UMat(img), res_1080p, interpolation=cv2.INTER_AREA)
+        u_720p = cv2.resize(u_1080p, res_720p, interpolation=cv2.INTER_AREA)
+        return u_1080p.get(), u_720p.get()
+    img_1080p = cv2.resize(img, res_1080p, interpolation=cv2.INTER_AREA)
+    img_720p = cv2.resize(img_1080p, res_720p, interpolation=cv2.INTER_AREA)
+    return img_1080p, img_720p
+
+def process(fname):
+    # One process per core already, keep OpenCV from spawning its own threads
+    cv2.setNumThreads(1)
+
+    src_path = os.path.join(input_folder, fname)
+    img = cv2.imread(src_path)
+    if img is None:
+        return fname, None, None
+
+    img_1080p, img_720p = resize(img)
+
+    # Encoding stays on this thread (one per core), only the 1080p file write
+    # goes to the writer thread so it overlaps the 720p encode
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=1)
+    out_1080p = os.path.join(output_1080p, fname)
+    data_1080p = encode_image(out_1080p, img_1080p)
+    fut_1080p = _io_pool.submit(write_bytes, out_1080p, data_1080p)
+
+    out_720p = os.path.join(output_720p, fname)
+    data_720p = encode_image(out_720p, img_720p)
+    write_bytes(out_720p, data_720p)
+
+    fut_1080p.result()
+    return fname, len(data_1080p), len(data_720p)
+
+if __name__ == "__main__":
+    # ===== PREPARE OUTPUT =====
+    os.makedirs(output_1080p, exist_ok=True)
+    os.makedirs(output_720p, exist_ok=True)
+
+    # ===== LIST AND SAMPLE IMAGES =====
+    with os.scandir(input_folder) as it:
+        all_images = [e.name for e in it if e.is_file() and e.name.lower().endswith(valid_exts)]
+    if len(all_images) < sample_count:
+        raise ValueError(f"Not enough images ({len(all_images)}) to sample {sample_count}")
+    sampled_images = random.sample(all_images, sample_count)
+
+    # ===== MANIFEST =====
+    # Workers only resize and write the images, the manifest is written here
+    manifest_file = "image_manifest.csv"
+    with open(manifest_file, mode="w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["filename", "resolution", "filesize_bytes"])  # header
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for fname, size_1080p, size_720p in executor.map(process, sampled_images, chunksize=8):
+                if size_1080p is None:
+                    print(f"Could not read {fname}, skipping.")
+                    continue
+
+                writer.writerow([fname, "1080p", size_1080p])
+                writer.writerow([fname, "720p", size_720p])
+
+                print(f"Processed {fname}")
 
+    print(f"\n Done! Manifest saved to '{manifest_file}'")
@@ -1,32 +1,70 @@
 #!/usr/bin/env python3
-import argparse, concurrent.futures as cf, csv, json, os, time
+import argparse, asyncio, concurrent.futures as cf, csv, json, mimetypes, os, sys, time
+from collections import deque
 from time import perf_counter
 from datetime import datetime
 from pathlib import Path
 import psutil
 from google.cloud import storage
+from google.cloud.storage import transfer_manager
+import google.auth
+from google.auth.transport.requests import Request
 import numpy as np
 import threading
 
-def monitor_system(interval_s: float, outfile: str, nic: str | None, stop_evt: threading.Event):
+# aiohttp is only needed for --engine aiohttp
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+GCS_UPLOAD_URL = "https://storage.googleapis.com/upload/storage/v1/b/{bucket}/o"
+LARGE_FILE_BYTES = 64 * 1024 * 1024  # above this, a single file is uploaded in parallel chunks
+MIN_PART_BYTES = 5 * 1024 * 1024     # XML multipart upload: every part but the last must be >= 5 MiB
+
+_log_lines = deque()
+
+def log(*args):
+    # Hot-loop logging: deque.append is thread-safe and never touches stdout,
+    # log_flusher writes the accumulated lines in one go
+    _log_lines.append(" ".join(map(str, args)))
+
+def flush_log():
+    lines = []
+    while _log_lines:
+        lines.append(_log_lines.popleft())
+    if lines:
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+
+def log_flusher(stop_evt: threading.Event, interval_s: float = 0.1):
+    while not stop_evt.wait(interval_s):
+        flush_log()
+    flush_log()
+
+def monitor_system(interval_s: float, outfile: str, nic: str | None, stop_evt: threading.Event, flush_every: int = 10):
     with open(outfile, "w", newline="") as f:
         w = csv.writer(f)
         w.writerow(["ts","cpu_percent","ram_percent","bytes_sent","bytes_recv","packets_sent","packets_recv","nic"])
         psutil.cpu_percent(interval=None)  # prime CPU measurement
+        batch = []  # samples are written in batches to avoid a write+flush per sample
         while not stop_evt.is_set():
             cpu = psutil.cpu_percent(interval=None)
             ram = psutil.virtual_memory().percent
-            if nic:
-                ni = psutil.net_io_counters(pernic=True).get(nic)
-                if ni is None:
-                    ni = psutil.net_io_counters(pernic=False)
-            else:
+            # The per-NIC table (one entry per interface) is only built when a NIC was asked for
+            ni = psutil.net_io_counters(pernic=True).get(nic) if nic else None
+            if ni is None:
                 ni = psutil.net_io_counters(pernic=False)
-            w.writerow([datetime.now().isoformat(), cpu, ram, ni.bytes_sent, ni.bytes_recv, ni.packets_sent, ni.packets_recv, nic or "aggregate"])
-            f.flush()
+            # Epoch seconds, much cheaper than formatting an ISO string per sample
+            batch.append([time.time(), cpu, ram, ni.bytes_sent, ni.bytes_recv, ni.packets_sent, ni.packets_recv, nic or "aggregate"])
+            if len(batch) >= flush_every:
+                w.writerows(batch)
+                f.flush()
+                batch.clear()
             stop_evt.wait(interval_s)
+        w.writerows(batch)
 
-def upload_one(client: storage.Client, bucket_name: str, path: str, dest_prefix: str, chunk_bytes: int | None, retries: int, timeout_s: int):
+def upload_one(client: storage.Client, bucket_name: str, path: str, dest_prefix: str, chunk_bytes: int | None, retries: int, timeout_s: int, parallel_chunks: int = 0):
     bucket = client.bucket(bucket_name)
     blob_name = f"{dest_prefix}/{os.path.basename(path)}" if dest_prefix else os.path.basename(path)
     blob = bucket.blob(blob_name)
@@ -39,7 +77,14 @@ def upload_one(client: storage.Client, bucket_name: str, path: str, dest_prefix:
     error = ""
     while True:
         try:
-            blob.upload_from_filename(path, timeout=timeout_s)
+            if parallel_chunks and chunk_bytes and size > LARGE_FILE_BYTES:
+                # Chunks go up in parallel (XML multipart upload) and are assembled server-side
+                transfer_manager.upload_chunks_concurrently(
+                    path, blob, chunk_size=max(chunk_bytes, MIN_PART_BYTES), deadline=timeout_s,
+                    worker_type=transfer_manager.THREAD, max_workers=parallel_chunks,
+                )
+            else:
+                blob.upload_from_filename(path, timeout=timeout_s)
             break
         except Exception as e:
             attempt += 1
@@ -59,6 +104,60 @@ def upload_one(client: storage.Client, bucket_name: str, path: str, dest_prefix:
         "error": error,
     }
 
+def get_access_token() -> str:
+    # Application-default credentials, the same ones storage.Client() uses.
+    # Tokens last ~1h, enough for one test run.
+    creds, _ = google.auth.default(scopes=["https://www.googleapis.com/auth/devstorage.read_write"])
+    creds.refresh(Request())
+    return creds.token
+
+async def upload_one_async(session, sem: asyncio.Semaphore, token: str, bucket_name: str, path: str, dest_prefix: str, retries: int, timeout_s: int):
+    blob_name = f"{dest_prefix}/{os.path.basename(path)}" if dest_prefix else os.path.basename(path)
+    size = os.path.getsize(path)
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": mimetypes.guess_type(path)[0] or "application/octet-stream",
+    }
+    params = {"uploadType": "media", "name": blob_name}
+    attempt = 0
+    status = "ok"
+    error = ""
+    async with sem:
+        # Read off the event loop so disk I/O does not stall the in-flight uploads
+        data = await asyncio.to_thread(Path(path).read_bytes)
+        start = perf_counter()
+        while True:
+            try:
+                async with session.post(GCS_UPLOAD_URL.format(bucket=bucket_name), params=params, data=data,
+                                        headers=headers, timeout=aiohttp.ClientTimeout(total=timeout_s)) as resp:
+                    resp.raise_for_status()
+                break
+            except Exception as e:
+                attempt += 1
+                if attempt > retries:
+                    status = "fail"
+                    error = f"{type(e).__name__}: {e}"
+                    break
+                await asyncio.sleep(min(2 ** attempt, 10))  # backoff
+        dur = perf_counter() - start
+    return {
+        "file": path,
+        "blob": blob_name,
+        "size_bytes": size,
+        "duration_s": dur,
+        "retries": attempt,
+        "status": status,
+        "error": error,
+    }
+
+async def upload_all_async(token: str, bucket_name: str, files: list[str], dest_prefix: str, retries: int, timeout_s: int, concurrency: int, on_result):
+    # One event loop thread keeps up to `concurrency` uploads in flight
+    sem = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        tasks = [upload_one_async(session, sem, token, bucket_name, f, dest_prefix, retries, timeout_s) for f in files]
+        for coro in asyncio.as_completed(tasks):
+            on_result(await coro)
+
 def main():
     ap = argparse.ArgumentParser(description="Measure Google Cloud Storage upload performance for a folder of files.")
     ap.add_argument("--folder", required=True, help="Folder containing files to upload")
@@ -71,6 +170,8 @@ def main():
     ap.add_argument("--sys-interval", type=float, default=1.0, help="System metrics sampling interval (seconds)")
     ap.add_argument("--nic", default=None, help="Optional NIC/interface name to monitor (e.g., 'wlan0', 'Ethernet'). Defaults to aggregate.")
     ap.add_argument("--outdir", default="results", help="Folder where output files will be written")
+    ap.add_argument("--parallel-chunks", type=int, default=4, help="Parallel chunk uploads for files over 64 MiB (threads engine). 0 uploads them sequentially.")
+    ap.add_argument("--engine", choices=["threads", "aiohttp"], default="threads", help="Upload with a thread pool (google-cloud-storage) or a single asyncio loop (aiohttp, single-request uploads, ignores --chunk-mb)")
     args = ap.parse_args()
 
     # Ensure output directory exists
@@ -78,7 +179,9 @@ def main():
     outdir.mkdir(parents=True, exist_ok=True)
 
     folder = Path(args.folder)
-    files = sorted([str(p) for p in folder.iterdir() if p.is_file()])
+    # DirEntry.is_file() uses the type from the directory listing, no stat() per file
+    with os.scandir(folder) as it:
+        files = sorted(e.path for e in it if e.is_file())
     if not files:
         raise SystemExit(f"No files found in {folder}")
 
@@ -86,7 +189,18 @@ def main():
     if chunk_bytes % (256 * 1024) != 0:
         raise SystemExit("--chunk-mb must be a multiple of 0.25 MiB (256 KiB)")
 
-    client = storage.Client()
+    if args.engine == "aiohttp":
+        if aiohttp is None:
+            raise SystemExit("--engine aiohttp requires the aiohttp package (pip install aiohttp)")
+        token = get_access_token()
+    else:
+        client = storage.Client()
+        # requests keeps at most 10 pooled connections per host, size the pool to the
+        # thread count (including the chunk threads of large files) so every
+        # upload reuses an open TLS connection. The existing adapter is resized
+        # rather than replaced, so a mutual-TLS adapter keeps its client cert.
+        pool = max(args.concurrency * max(1, args.parallel_chunks), 10)
+        client._http.get_adapter("https://storage.googleapis.com").init_poolmanager(pool, pool)
 
     stop_evt = threading.Event()
     mon_thr = threading.Thread(
@@ -99,18 +213,42 @@ def main():
     t0 = perf_counter()
     print("Starting monitoring time: ", t0)
     rows, failed = [], 0
+    # Sizes and durations of successful uploads, filled as results arrive
+    sizes = np.empty(len(files), dtype=float)
+    durs = np.empty(len(files), dtype=float)
+    n_ok = 0
+
+    def record(r):
+        nonlocal failed, n_ok
+        rows.append(r)
+        if r["status"] == "ok":
+            sizes[n_ok] = r["size_bytes"]
+            durs[n_ok] = r["duration_s"]
+            n_ok += 1
+        else:
+            failed += 1
+        log(f"{os.path.basename(r['file'])}: {r['status']} {r['duration_s']:.2f}s, retries={r['retries']}")
+
+    log_stop = threading.Event()
+    log_thr = threading.Thread(target=log_flusher, args=(log_stop,), daemon=True)
+    log_thr.start()
+
+    try:
+        if args.engine == "aiohttp":
+            print("Starting sending time: ", perf_counter())
+            asyncio.run(upload_all_async(token, args.bucket, files, args.prefix, args.retries, args.timeout_s, args.concurrency, record))
+        else:
+            with cf.ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+                print("Starting sending time: ", perf_counter())
+                futs = [ex.submit(upload_one, client, args.bucket, f, args.prefix, chunk_bytes, args.retries, args.timeout_s, args.parallel_chunks) for f in files]
+                for fut in cf.as_completed(futs):
+                    record(fut.result())
+        wall = perf_counter() - t0
+    finally:
+        # The flusher is a daemon thread, drain it even if an upload raised or on Ctrl+C
+        log_stop.set()
+        log_thr.join()
 
-    with cf.ThreadPoolExecutor(max_workers=args.concurrency) as ex:
-        print("Starting sending time: ", perf_counter())
-        futs = [ex.submit(upload_one, client, args.bucket, f, args.prefix, chunk_bytes, args.retries, args.timeout_s) for f in files]
-        for fut in cf.as_completed(futs):
-            r = fut.result()
-            rows.append(r)
-            if r["status"] != "ok":
-                failed += 1
-            print(f"{os.path.basename(r['file'])}: {r['status']} {r['duration_s']:.2f}s, retries={r['retries']}")
-
-    wall = perf_counter() - t0
     stop_evt.set()
     mon_thr.join(timeout=2)
 
@@ -121,7 +259,7 @@ def main():
         ni = psutil.net_io_counters(pernic=True).get(args.nic) if args.nic else psutil.net_io_counters(pernic=False)
         cpu = psutil.cpu_percent(interval=None)
         ram = psutil.virtual_memory().percent
-        w.writerow([datetime.now().isoformat(), cpu, ram, ni.bytes_sent, ni.bytes_recv, ni.packets_sent, ni.packets_recv, args.nic or "aggregate"])
+        w.writerow([time.time(), cpu, ram, ni.bytes_sent, ni.bytes_recv, ni.packets_sent, ni.packets_recv, args.nic or "aggregate"])
 
     with open(outdir / "uploads_log.csv", "w", newline="") as f:
         w = csv.DictWriter(f, fieldnames=["file","blob","size_bytes","duration_s","retries","status","error"])
@@ -129,13 +267,12 @@ def main():
         w.writerows(rows)
 
 
-    sizes = np.array([r["size_bytes"] for r in rows if r["status"] == "ok"], dtype=float)
-    durs  = np.array([r["duration_s"] for r in rows if r["status"] == "ok"], dtype=float)
+    sizes, durs = sizes[:n_ok], durs[:n_ok]
     total_bytes = float(sizes.sum()) if sizes.size else 0.0
     agg_mbps = (total_bytes * 8.0) / wall / 1e6 if wall > 0 else 0.0
 
-    def pct(a, p): 
-        return float(np.percentile(a, p)) if a.size else None
+    # One sort for all four percentiles
+    qs = np.quantile(durs, [0.5, 0.9, 0.95, 0.99]).tolist() if durs.size else [None] * 4
 
     summary = {
         "files_total": len(rows),
@@ -144,14 +281,12 @@ def main():
         "bytes_total": int(total_bytes),
         "wall_seconds": wall,
         "throughput_mbps_wall": agg_mbps,
-        "per_file_latency_s": {
-            "p50": pct(durs, 50),
-            "p90": pct(durs, 90),
-            "p95": pct(durs, 95),
-            "p99": pct(durs, 99),
-        },
+        "per_file_latency_s": {"p50": qs[0], "p90": qs[1], "p95": qs[2], "p99": qs[3]},
         "concurrency": args.concurrency,
-        "chunk_mb": args.chunk_mb,
+        "engine": args.engine,
+        # The aiohttp engine sends each file in one request, these do not apply
+        "chunk_mb": args.chunk_mb if args.engine == "threads" else None,
+        "parallel_chunks": args.parallel_chunks if args.engine == "threads" else None,
         "retries": args.retries,
         "prefix": args.prefix,
         "nic": args.nic or "aggregate",
@@ -1,7 +1,43 @@
-import csv
 import json
 import argparse
+from datetime import datetime
 from pathlib import Path
+import numpy as np
+
+# numba es opcional, sin él el kernel corre como Python normal
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        return lambda f: f
+
+def parse_ts(value: str) -> datetime:
+    # Epoch seconds en las medidas nuevas, ISO en las antiguas
+    try:
+        return datetime.fromtimestamp(float(value))
+    except ValueError:
+        return datetime.fromisoformat(value)
+
+def ts_to_epoch(ts: np.ndarray) -> np.ndarray:
+    try:
+        return ts.astype(np.float64)
+    except ValueError:
+        return np.array([parse_ts(t).timestamp() for t in ts], dtype=np.float64)
+
+@njit(cache=True, fastmath=True)
+def rate_stats(ts, bytes_sent, bytes_recv, packets_sent):
+    # Tasas entre muestras consecutivas: Mbps de subida, Mbps de bajada y paquetes/s enviados
+    n = ts.shape[0] - 1 if ts.shape[0] > 1 else 0
+    tx_mbps = np.zeros(n)
+    rx_mbps = np.zeros(n)
+    tx_pps = np.zeros(n)
+    for i in range(n):
+        dt = ts[i + 1] - ts[i]
+        if dt > 0:
+            tx_mbps[i] = (bytes_sent[i + 1] - bytes_sent[i]) * 8.0 / dt / 1e6
+            rx_mbps[i] = (bytes_recv[i + 1] - bytes_recv[i]) * 8.0 / dt / 1e6
+            tx_pps[i] = (packets_sent[i + 1] - packets_sent[i]) / dt
+    return tx_mbps, rx_mbps, tx_pps
 
 def main():
     # --- CONFIG ---
@@ -22,30 +58,47 @@ def main():
     bytes_total = summary.get("bytes_total", 0)
 
     # --- 2. Leer bytes_sent inicial y final de sys_metrics.csv ---
-    with open(sys_metrics_file) as f:
-        reader = csv.DictReader(f)
-        bytes_sent_list = [int(row["bytes_sent"]) for row in reader]
+    # Solo las columnas ts, bytes_sent, bytes_recv y packets_sent (índices 0, 3, 4 y 5), parseadas en C a un ndarray
+    cols = np.loadtxt(sys_metrics_file, delimiter=",", skiprows=1, usecols=(0, 3, 4, 5), dtype=str, ndmin=2)
 
-    if not bytes_sent_list:
+    if not cols.size:
         raise ValueError("No se encontraron datos en sys_metrics.csv")
 
-    delta_bytes_sent = bytes_sent_list[-1] - bytes_sent_list[0]
-    print("Last bytes received counter: ", bytes_sent_list[-1])
-    print("First bytes received counter: ", bytes_sent_list[0])
+    ts = cols[:, 0]
+    bytes_sent = cols[:, 1].astype(np.int64)
+    bytes_recv = cols[:, 2].astype(np.int64)
+    packets_sent = cols[:, 3].astype(np.int64)
+    print("Measurement window: ", parse_ts(ts[0]).isoformat(), "->", parse_ts(ts[-1]).isoformat())
+
+    delta_bytes_sent = int(bytes_sent[-1] - bytes_sent[0])
+    print("Last bytes received counter: ", int(bytes_sent[-1]))
+    print("First bytes received counter: ", int(bytes_sent[0]))
 
     # --- 3. Calcular overhead ---
     overhead_pct = ((delta_bytes_sent - bytes_total) / bytes_total) * 100 if bytes_total > 0 else None
 
-    # --- 4. Mostrar resultados ---
+    # --- 4. Throughput por intervalo de muestreo ---
+    tx_mbps, rx_mbps, tx_pps = rate_stats(ts_to_epoch(ts), bytes_sent, bytes_recv, packets_sent)
+    rates = {
+        "Throughput subida medio (Mbps)": float(tx_mbps.mean()) if tx_mbps.size else None,
+        "Throughput subida máximo (Mbps)": float(tx_mbps.max()) if tx_mbps.size else None,
+        "Throughput bajada medio (Mbps)": float(rx_mbps.mean()) if rx_mbps.size else None,
+        "Paquetes enviados por segundo (medio)": float(tx_pps.mean()) if tx_pps.size else None,
+    }
+
+    # --- 5. Mostrar resultados ---
     print(f"Bytes totales subidos (archivos): {bytes_total:,} B")
     print(f"Bytes enviados según NIC: {delta_bytes_sent:,} B")
     print(f"Overhead de red aproximado: {overhead_pct:.2f} %")
+    for name, value in rates.items():
+        print(f"{name}: {value:.2f}" if value is not None else f"{name}: -")
 
     if(outdir):
         metrics = {
             "Bytes totales": bytes_total,
             "Bytes enviados según NIC": delta_bytes_sent,
-            "Overhead de red aproximado": overhead_pct
+            "Overhead de red aproximado": overhead_pct,
+            **rates,
         }
 
         with open(outdir / "metrics.json", "w") as f:
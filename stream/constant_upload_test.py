@@ -1,4 +1,4 @@
-import argparse, concurrent.futures as cf, csv, json, os, time
+import argparse, concurrent.futures as cf, csv, itertools, json, os, platform, sys, time
 from time import perf_counter
 from datetime import datetime
 from pathlib import Path
@@ -9,41 +9,95 @@ import threading
 from collections import deque
 from queue import Queue, Full, Empty
 import cv2
-from io import BytesIO
+
+# libjpeg-turbo is optional, OpenCV's encoder is used when it is missing.
+# The PyTurboJPEG wheel does not ship libturbojpeg, so loading it can fail too.
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+    _tj = TurboJPEG()  # shared instance, library init is paid once
+except (ImportError, OSError, RuntimeError):
+    _tj = None
+
+# Frame names: host + run start + counter, unique and sortable across uploader threads
+_run_id = f"{platform.node()}-{int(time.time())}"
+_frame_counter = itertools.count()
+
+# ============================
+# Deferred logging
+# ============================
+_log_lines = deque()
+
+def log(*args):
+    # Hot-loop logging: deque.append is thread-safe and never touches stdout,
+    # log_flusher writes the accumulated lines in one go
+    _log_lines.append(" ".join(map(str, args)))
+
+def flush_log():
+    lines = []
+    while _log_lines:
+        lines.append(_log_lines.popleft())
+    if lines:
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+
+def log_flusher(stop_evt: threading.Event, interval_s: float = 0.1):
+    while not stop_evt.wait(interval_s):
+        flush_log()
+    flush_log()
 
 # ============================
 # System monitoring
 # ============================
-def monitor_system(interval_s: float, outfile: str, nic: str | None, stop_evt: threading.Event):
+def monitor_system(interval_s: float, outfile: str, nic: str | None, stop_evt: threading.Event, flush_every: int = 10):
     with open(outfile, "w", newline="") as f:
         w = csv.writer(f)
         w.writerow(["ts","cpu_percent","ram_percent","bytes_sent","bytes_recv","packets_sent","packets_recv","nic"])
         psutil.cpu_percent(interval=None)  # prime CPU measurement
+        batch = []  # samples are written in batches to avoid a write+flush per sample
         while not stop_evt.is_set():
             cpu = psutil.cpu_percent(interval=None)
             ram = psutil.virtual_memory().percent
-            if nic:
-                ni = psutil.net_io_counters(pernic=True).get(nic)
-                if ni is None:
-                    ni = psutil.net_io_counters(pernic=False)
-            else:
+            # The per-NIC table (one entry per interface) is only built when a NIC was asked for
+            ni = psutil.net_io_counters(pernic=True).get(nic) if nic else None
+            if ni is None:
                 ni = psutil.net_io_counters(pernic=False)
-            w.writerow([datetime.now().isoformat(), cpu, ram, ni.bytes_sent, ni.bytes_recv, ni.packets_sent, ni.packets_recv, nic or "aggregate"])
-            f.flush()
+            # Epoch seconds, much cheaper than formatting an ISO string per sample
+            batch.append([time.time(), cpu, ram, ni.bytes_sent, ni.bytes_recv, ni.packets_sent, ni.packets_recv, nic or "aggregate"])
+            if len(batch) >= flush_every:
+                w.writerows(batch)
+                f.flush()
+                batch.clear()
             stop_evt.wait(interval_s)
+        w.writerows(batch)
+
+# ============================
+# JPEG encoding
+# ============================
+def encode_frame(frame, quality: int):
+    if frame.ndim == 1 or frame.shape[0] == 1:
+        # Undecoded MJPEG buffer from the camera, already a JPEG
+        return memoryview(frame.reshape(-1))
+    if _tj is not None:
+        return _tj.encode(frame, quality=quality, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)  # 4:2:0 like OpenCV
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+    if quality < 75:
+        params += [int(cv2.IMWRITE_JPEG_OPTIMIZE), 1]  # optimized Huffman tables pay off at low quality
+    ok, buf = cv2.imencode(".jpg", frame, params)
+    # View of the encoded buffer, uploader_worker copies it to bytes (upload_from_string only takes bytes)
+    return memoryview(buf.reshape(-1)) if ok else None
 
 # ============================
 # Upload one frame (in-memory)
 # ============================
 def upload_one_bytes(client: storage.Client, bucket_name: str, data: bytes, dest_prefix: str, retries: int, timeout_s: int):
     bucket = client.bucket(bucket_name)
-    blob_name = f"{dest_prefix}/{datetime.utcnow().isoformat()}.jpg"
+    blob_name = f"{dest_prefix}/{_run_id}-{next(_frame_counter):08d}.jpg"
     blob = bucket.blob(blob_name)
     attempt, status, error = 0, "ok", ""
     start = perf_counter()
     while True:
         try:
-            blob.upload_from_file(BytesIO(data), timeout=timeout_s, content_type="image/jpeg")
+            blob.upload_from_string(data, content_type="image/jpeg", timeout=timeout_s)
             break
         except Exception as e:
             attempt += 1
@@ -82,6 +136,10 @@ def main():
     ap.add_argument("--max-mb", type=int, default=500, help="Max total upload (MB)")
     ap.add_argument("--queue-size", type=int, default=20, help="Max for streaming queue")
     ap.add_argument("--force-resolution", type=int, default=0, help="Set to 1 to drop all images to 720p")
+    ap.add_argument("--jpeg-quality", type=int, default=85, help="Initial JPEG quality of the uploaded frames (1-100)")
+    ap.add_argument("--min-jpeg-quality", type=int, default=50, help="Minimum JPEG quality")
+    ap.add_argument("--max-jpeg-quality", type=int, default=95, help="Maximum JPEG quality")
+    ap.add_argument("--mjpeg-passthrough", type=int, default=0, help="Set to 1 to upload the camera's MJPEG frames without re-encoding")
     args = ap.parse_args()
 
     outdir = Path(args.outdir)
@@ -102,11 +160,37 @@ def main():
     cap = cv2.VideoCapture(0)
     if not cap.isOpened():
         raise SystemExit("Could not open webcam")
+
+    # Most webcams output MJPEG natively, ask for it instead of raw YUYV
+    mjpg = cv2.VideoWriter_fourcc(*"MJPG")
+    cap.set(cv2.CAP_PROP_FOURCC, mjpg)
     
     if args.force_resolution==1:
         cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
         cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
 
+    # Checked after the resolution change, which can renegotiate the format
+    passthrough = False
+    if args.mjpeg_passthrough==1:
+        if int(cap.get(cv2.CAP_PROP_FOURCC)) == mjpg:
+            # Keep the camera's JPEG buffer undecoded so it can be uploaded as is
+            cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+            # Some backends ignore the setting and keep decoding, check an actual frame
+            ret, probe = cap.read()
+            passthrough = ret and (probe.ndim == 1 or probe.shape[0] == 1)
+            if not passthrough:
+                print("Warning: capture backend still decodes MJPG, frames will be re-encoded")
+        else:
+            print("Warning: webcam did not accept MJPG, frames will be decoded and re-encoded")
+
+    # Ring of reusable frame buffers: the queue carries buffer indices and
+    # uploaders hand each index back once the frame is sent. One buffer per
+    # queue slot plus one per uploader, allocated on first use by cap.read().
+    frame_bufs = [None] * (args.queue_size + args.concurrency)
+    free_bufs = Queue()
+    for i in range(len(frame_bufs)):
+        free_bufs.put(i)
+
     frame_queue = Queue(maxsize=args.queue_size)
     rows = []
     sent_bytes = 0
@@ -115,6 +199,7 @@ def main():
     last_fps_print = time.time()
     start_time = time.time()
     fps = args.init_fps
+    jpeg_q = args.jpeg_quality
 
     recent_lock = threading.Lock()
     recent_uploads = deque(maxlen=20)
@@ -123,74 +208,111 @@ def main():
         nonlocal sent_bytes
         while not stop_evt.is_set() or not frame_queue.empty():
             try:
-                data = frame_queue.get(timeout=0.5)
+                i = frame_queue.get(timeout=0.5)
             except Empty:
                 continue
+            # Encoding here spreads the JPEG work over all uploader threads
+            data = encode_frame(frame_bufs[i], jpeg_q)
+            if isinstance(data, memoryview):
+                data = data.tobytes()  # the single copy; passthrough data is a view of the frame buffer
+            free_bufs.put(i)  # the buffer is free again before the upload and its retries
+            if data is None:
+                frame_queue.task_done()
+                continue
             r = upload_one_bytes(client, args.bucket, data, args.prefix, args.retries, args.timeout_s)
             rows.append(r)
             sent_bytes += r["size_bytes"]
             frame_queue.task_done()
             with recent_lock:
                 recent_uploads.append(r["duration_s"])
-            print(f"Frame: {r['status']} {r['duration_s']:.2f}s, retries={r['retries']}")
+            log(f"Frame: {r['status']} {r['duration_s']:.2f}s, retries={r['retries']}")
 
-    # Start uploader threads
-    with cf.ThreadPoolExecutor(max_workers=args.concurrency) as ex:
-        for _ in range(args.concurrency):
-            ex.submit(uploader_worker)
+    log_stop = threading.Event()
+    log_thr = threading.Thread(target=log_flusher, args=(log_stop,), daemon=True)
+    log_thr.start()
 
-        try:
-            while True:
-                loop_start = time.perf_counter()
-                ret, frame = cap.read()
-                if not ret:
-                    print("Frame capture failed, stopping.")
-                    break
-
-                ok, buf = cv2.imencode(".jpg", frame)
-                if not ok:
-                    continue
-                data = buf.tobytes()
-
-                try:
-                    frame_queue.put_nowait(data)
-                except Full:
-                    print("Queue full, dropping frame")
-
-                # Track FPS:
-                frames_done += 1
-                now = time.time()
-                if now - last_fps_print >= 1.0:
-                    real_fps = frames_done / (now - start_time)
-                    print(f"\t\tTarget FPS={fps}, Real FPS={real_fps:.2f}, Queue={frame_queue.qsize()}")
-                    last_fps_print = now
-
-                # Adjust FPS based on queue occupancy
-                qsize = frame_queue.qsize()
-                if qsize > args.queue_size * 0.8 and fps > args.min_fps:
-                    fps -= 1
-                    print("New FPS: ", fps)
-                elif qsize < args.queue_size * 0.2 and fps < args.max_fps:
-                    fps += 1
-                    print("New FPS: ", fps)
-
-                interval = 1.0 / fps
-
-                # Stop conditions
-                if (time.time() - start_time) > args.max_seconds:
-                    print("Reached time limit, stopping.")
-                    break
-                if sent_bytes > args.max_mb * 1024 * 1024:
-                    print("Reached size limit, stopping.")
-                    break
-
-                elapsed = time.perf_counter() - loop_start
-                if elapsed < interval:
-                    time.sleep(interval - elapsed)
-        finally:
-            cap.release()
-            stop_evt.set()
-            mon_thr.join(timeout=2)
+    # The flusher is a daemon thread: drain it even on Ctrl+C or errors,
+    # after the uploaders have finished logging
+    try:
+        # Start uploader threads
+        with cf.ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+            for _ in range(args.concurrency):
+                ex.submit(uploader_worker)
+
+            try:
+                while True:
+                    loop_start = time.perf_counter()
+                    try:
+                        i = free_bufs.get_nowait()
+                    except Empty:
+                        i = None
+
+                    if i is None:
+                        # Every buffer is queued or being uploaded, grab without decoding
+                        ret = cap.grab()
+                    else:
+                        # Decodes into the buffer in place once its shape is known
+                        ret, frame_bufs[i] = cap.read(frame_bufs[i])
+                    if not ret:
+                        log("Frame capture failed, stopping.")
+                        break
+
+                    if i is None:
+                        log("Queue full, dropping frame")
+                    else:
+                        try:
+                            frame_queue.put_nowait(i)
+                        except Full:
+                            free_bufs.put(i)
+                            log("Queue full, dropping frame")
+
+                    # Track FPS:
+                    frames_done += 1
+                    now = time.time()
+                    if now - last_fps_print >= 1.0:
+                        real_fps = frames_done / (now - start_time)
+                        log(f"\t\tTarget FPS={fps}, Real FPS={real_fps:.2f}, Queue={frame_queue.qsize()}")
+                        last_fps_print = now
+
+                    # Adjust JPEG quality and FPS based on queue occupancy: quality is
+                    # lowered first to keep the frame rate, FPS only once it hits the
+                    # minimum. Passthrough frames are never re-encoded, so only FPS adapts.
+                    qsize = frame_queue.qsize()
+                    if qsize > args.queue_size * 0.8:
+                        if not passthrough and jpeg_q > args.min_jpeg_quality:
+                            jpeg_q = max(args.min_jpeg_quality, jpeg_q - 5)
+                            log("New JPEG quality: ", jpeg_q)
+                        elif fps > args.min_fps:
+                            fps -= 1
+                            log("New FPS: ", fps)
+                    elif qsize < args.queue_size * 0.2:
+                        if fps < args.max_fps:
+                            fps += 1
+                            log("New FPS: ", fps)
+                        elif not passthrough and jpeg_q < args.max_jpeg_quality:
+                            jpeg_q = min(args.max_jpeg_quality, jpeg_q + 5)
+                            log("New JPEG quality: ", jpeg_q)
+
+                    interval = 1.0 / fps
+
+                    # Stop conditions
+                    if (time.time() - start_time) > args.max_seconds:
+                        log("Reached time limit, stopping.")
+                        break
+                    if sent_bytes > args.max_mb * 1024 * 1024:
+                        log("Reached size limit, stopping.")
+                        break
+
+                    elapsed = time.perf_counter() - loop_start
+                    if elapsed < interval:
+                        time.sleep(interval - elapsed)
+            finally:
+                cap.release()
+                stop_evt.set()
+                mon_thr.join(timeout=2)
+    finally:
+        log_stop.set()
+        log_thr.join()
 
     # Write logs
     with open(outdir / "uploads_log.csv", "w", newline="") as f:
@@ -204,8 +326,8 @@ def main():
     wall = time.time() - start_time
     agg_mbps = (total_bytes * 8.0) / wall / 1e6 if wall > 0 else 0.0
 
-    def pct(a, p): 
-        return float(np.percentile(a, p)) if a.size else None
+    # One sort for all four percentiles
+    qs = np.quantile(durs, [0.5, 0.9, 0.95, 0.99]).tolist() if durs.size else [None] * 4
 
     real_fps = frames_done / wall if wall > 0 else 0.0
 
@@ -215,13 +337,10 @@ def main():
         "wall_seconds": wall,
         "throughput_mbps_wall": agg_mbps,
         "FPS_avg": real_fps,
-        "per_frame_latency_s": {
-            "p50": pct(durs, 50),
-            "p90": pct(durs, 90),
-            "p95": pct(durs, 95),
-            "p99": pct(durs, 99),
-        },
+        "per_frame_latency_s": {"p50": qs[0], "p90": qs[1], "p95": qs[2], "p99": qs[3]},
         "concurrency": args.concurrency,
+        "jpeg_quality_init": None if passthrough else args.jpeg_quality,
+        "jpeg_quality_final": None if passthrough else jpeg_q,
         "prefix": args.prefix,
         "nic": args.nic or "aggregate",
         "sys_interval": args.sys_interval,